@@ -1,39 +1,99 @@
 import os
+import sys
 import json
+import argparse
 import requirements
-from cyclonedx.model.bom import Bom
-from dataclasses import dataclass, asdict, field
-from sortedcontainers import SortedSet
-from typing import Any
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, TextIO
 
 DS1_PATH = os.path.join(".", "ds1")
 DS2_PATH = os.path.join(".", "ds2")
 
-@dataclass(eq=True, frozen=True)
+@dataclass(eq=True, frozen=True, slots=True)
 class Package():
     name: str
 
-@dataclass(eq=True, frozen=True)
+@dataclass(eq=True, frozen=True, slots=True)
 class ImportStatement():
     imports: Package
     imported: Package
     
-@dataclass(eq=True, frozen=True)
+@dataclass(eq=False)
 class DependencyGraph():
-    packages: list[Package] = field(default_factory=list)
-    import_statements: list[ImportStatement] = field(default_factory=list)
+    """
+    Adjacency map with package names interned to integer ids, dicts being used as insertion-ordered sets
+    """
+    _ids: dict[str, int] = field(default_factory=dict)
+    _names: list[str] = field(default_factory=list)
+    _imports: list[dict[int, None]] = field(default_factory=list)
+    _imported_by: list[dict[int, None]] = field(default_factory=list)
+
+    def _intern(self, package_name: str) -> int:
+        package_id = self._ids.get(package_name)
+        if package_id is None:
+            package_id = len(self._names)
+            package_name = sys.intern(package_name)
+            self._ids[package_name] = package_id
+            self._names.append(package_name)
+            self._imports.append({})
+            self._imported_by.append({})
+        return package_id
 
     def insert_package(self, package_name: str) -> Package:
-        new_package = Package(package_name)
-        self.packages.append(new_package)
+        self._intern(package_name)
 
-        return new_package
+        return Package(package_name)
 
     def insert_importstatement(self, imports: Package, imported: Package):
-        new_importstatement = ImportStatement(imports, imported)
-        self.import_statements.append(new_importstatement)
-
-        return new_importstatement
+        imports_id = self._intern(imports.name)
+        imported_id = self._intern(imported.name)
+        self._imports[imports_id][imported_id] = None
+        self._imported_by[imported_id][imports_id] = None
+
+        return ImportStatement(imports, imported)
+
+    def has_package(self, package_name: str) -> bool:
+        return package_name in self._ids
+
+    def has_importstatement(self, imports: Package, imported: Package) -> bool:
+        imports_id = self._ids.get(imports.name)
+        imported_id = self._ids.get(imported.name)
+        if imports_id is None or imported_id is None:
+            return False
+        return imported_id in self._imports[imports_id]
+
+    def imports(self, package: Package) -> list[ImportStatement]:
+        package_id = self._ids.get(package.name)
+        if package_id is None:
+            return []
+        return [ImportStatement(package, Package(self._names[i])) for i in self._imports[package_id]]
+
+    def imported_by(self, package: Package) -> list[ImportStatement]:
+        package_id = self._ids.get(package.name)
+        if package_id is None:
+            return []
+        return [ImportStatement(Package(self._names[i]), package) for i in self._imported_by[package_id]]
+
+    def to_dict(self) -> dict:
+        return {
+            "packages": [{"name": name} for name in self._names],
+            "import_statements": [
+                {"imports": {"name": self._names[imports_id]}, "imported": {"name": self._names[imported_id]}}
+                for imports_id, imported_ids in enumerate(self._imports)
+                for imported_id in imported_ids
+            ],
+        }
+
+    @staticmethod
+    def from_dict(d: dict) -> "DependencyGraph":
+        graph = DependencyGraph()
+        for package in d["packages"]:
+            graph.insert_package(package["name"])
+        for statement in d["import_statements"]:
+            graph.insert_importstatement(Package(statement["imports"]["name"]), Package(statement["imported"]["name"]))
+        return graph
 
 @dataclass
 class PackageAnalysis:
@@ -43,32 +103,72 @@ class PackageAnalysis:
     packages_path: str
     ground_truth: DependencyGraph | None
 
+    def to_dict(self) -> dict:
+        return {
+            "source_path": self.source_path,
+            "graphs": {tool: graph.to_dict() for tool, graph in self.graphs.items()},
+            "raw_packages_from_metadata": self.raw_packages_from_metadata,
+            "packages_path": self.packages_path,
+            "ground_truth": self.ground_truth.to_dict() if self.ground_truth is not None else None,
+        }
+
 @dataclass
 class Dataset:
     package_analyses: dict[str, PackageAnalysis] = field(default_factory=dict)
 
-def generate_ds1():
-    packages = os.listdir(os.path.join(DS1_PATH, "packages"))
+    def to_dict(self) -> dict:
+        return {
+            "package_analyses": {
+                package: analysis.to_dict() for package, analysis in self.package_analyses.items()
+            }
+        }
+
+def map_units(function: Callable, units: list, executor: Executor | None) -> Iterator:
+    """
+    Runs function over every unit, in a process pool when there is one. 
+    The results come back in the units' order either way, which keeps the merged datasets deterministic
+    """
+    if executor is None:
+        return map(function, units)
+    return executor.map(function, units)
+
+def read_requirements(requirements_path: str) -> list[str]:
+    raw_requirements = list()
+
+    with open(requirements_path) as requirements_file:
+        for req in requirements.parse(requirements_file):
+            if (req.name is None):
+                raw_requirements.append(req.line)
+            else:
+                raw_requirements.append(req.name)
+
+    return raw_requirements
+
+def generate_ds1(executor: Executor | None = None):
+    packages = [
+        package for package in sorted(os.listdir(os.path.join(DS1_PATH, "packages")), key=str.lower) 
+        if os.path.exists(os.path.join(DS1_PATH, "packages", package, "requirements.txt"))
+    ]
+    tools = sorted(os.listdir(os.path.join(DS1_PATH, "sbom")), key=str.lower) # listed in the same order on every platform
     dataset = Dataset()
 
-    for package in packages: 
-        requirements_path = os.path.join(os.path.join(DS1_PATH, "packages", package, "requirements.txt"))
-        if not os.path.exists(requirements_path):
-            continue
-        
-        raw_requirements = list()
-
-        with open(requirements_path) as requirements_file:
-            for req in requirements.parse(requirements_file):
-                if (req.name is None):
-                    raw_requirements.append(req.line)
-                else:
-                    raw_requirements.append(req.name)
-        
+    # every (package, tool) is a unit of its own
+    all_requirements = map_units(
+        read_requirements, 
+        [os.path.join(DS1_PATH, "packages", package, "requirements.txt") for package in packages], 
+        executor
+    )
+    all_graphs = map_units(
+        import_sbom, 
+        [os.path.join(DS1_PATH, "sbom", tool, package + "-result.json") for package in packages for tool in tools], 
+        executor
+    )
+
+    for package, raw_requirements in zip(packages, all_requirements): 
         dataset.package_analyses[package] = PackageAnalysis(
             source_path=os.path.join(DS1_PATH, "packages", package, "src", package, "main.py"),
             raw_packages_from_metadata=raw_requirements,
-            graphs=import_ds1_sboms(os.path.join(DS1_PATH, "sbom"), package),
+            graphs={tool: next(all_graphs) for tool in tools},
             packages_path=os.path.join(DS1_PATH, "packages", package, "env", "Lib", "site-packages"),
             ground_truth=None
         )
@@ -76,82 +176,280 @@ def generate_ds1():
 
     with open("merged_ds1.json", "w") as json_file:
         json_file.write(
-           json.dumps(asdict(dataset))
+           json.dumps(dataset.to_dict())
         )
 
+class JsonStream:
+    """
+    Reads a json document chunk by chunk, so that only the values being looked at are held in memory
+    """
+    def __init__(self, json_file: TextIO, chunk_size: int = 64 * 1024):
+        self.json_file = json_file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, size: int) -> bool:
+        if self.eof:
+            return False
+        chunk = self.json_file.read(size)
+        if chunk == "":
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in " \t\n\r":
+                self.position += 1
+            if self.position < len(self.buffer) or not self._fill(self.chunk_size):
+                break
+        return self.buffer[self.position:self.position + 1]
+
+    def expect(self, character: str) -> None:
+        if self.peek() != character:
+            raise ValueError("Expected {!r} at offset {}".format(character, self.position))
+        self.position += 1
+
+    def decode(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # a number cut by the end of the chunk would still decode, hence the check
+                if end < len(self.buffer) or not self._fill(self.chunk_size):
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                # the value does not fit in the buffer yet, doubling it keeps the retries linear overall
+                if not self._fill(max(self.chunk_size, len(self.buffer))):
+                    raise
+
+    def iter_array(self) -> Iterator[None]:
+        """
+        Yields once per element, the stream being positioned at the element's start
+        """
+        self.expect("[")
+        if self.peek() == "]":
+            self.position += 1
+            return
+        while True:
+            yield
+            if self.peek() == ",":
+                self.position += 1
+            else:
+                self.expect("]")
+                return
+
+    def iter_object(self) -> Iterator[str]:
+        """
+        Yields every key, the stream being positioned at the key's value
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self.position += 1
+            return
+        while True:
+            key = self.decode()
+            self.expect(":")
+            yield key
+            if self.peek() == ",":
+                self.position += 1
+            else:
+                self.expect("}")
+                return
+
+    def skip(self) -> None:
+        if self.peek() == "[":
+            for _ in self.iter_array():
+                self.skip()
+        elif self.peek() == "{":
+            for _ in self.iter_object():
+                self.skip()
+        else:
+            self.decode()
+
+def iter_top_level_arrays(
+    json_file: TextIO, 
+    keys: set[str], 
+    value_keys: set[str] = frozenset()
+) -> Iterator[tuple[str, Any]]:
+    """
+    Yields (key, element) for each element of the document's top-level arrays named in keys, 
+    and (key, value) for the top-level values named in value_keys, everything else is skipped without being kept
+    """
+    stream = JsonStream(json_file)
+    for key in stream.iter_object():
+        if key in keys and stream.peek() == "[":
+            for _ in stream.iter_array():
+                yield (key, stream.decode())
+        elif key in value_keys:
+            yield (key, stream.decode())
+        else:
+            stream.skip()
+
+def package_name_from_ref(ref: str) -> str:
+    # refs are mostly purls, like pkg:pypi/name@version
+    start = ref.find("/") + 1
+    end = ref.find("@")
+    if end == -1: end = None
+
+    return ref[start:end]
+
 def extract_dependencies(
-    child_packages: SortedSet, 
-    parent_package: Package | None, 
-    graph: DependencyGraph
+    dependencies: list[tuple[str, list[str]]], 
+    graph: DependencyGraph,
+    names: dict[str, str] | None = None
 ):
-    for child in child_packages:
-        start = str(child.ref.value).find("/") + 1
-        end = str(child.ref.value).find("@")
-        if end == -1: end = None
-
-        child_package = graph.insert_package(child.ref.value[start:end])
-        if len(child.dependencies) > 0:
-            extract_dependencies(child.dependencies, child_package, graph)
-
-        if (parent_package is not None):
+    """
+    names maps the refs to the names of their components or packages, other refs are taken as purls
+    """
+    names = names or {}
+    def name_of(ref: str) -> str:
+        return names.get(ref) or package_name_from_ref(ref)
+
+    # sorted by ref, the same order cyclonedx's Bom used to give us
+    for ref, depends_on in sorted(dependencies, key=lambda dependency: dependency[0]):
+        parent_package = graph.insert_package(name_of(ref))
+        for child_ref in sorted(depends_on):
+            child_package = graph.insert_package(name_of(child_ref))
             graph.insert_importstatement(parent_package, child_package)
 
-def import_ds1_sboms(path: str, package: str) -> dict[str, DependencyGraph]:
-    results = {}
-
-    tools = os.listdir(path)
-    for tool in tools:
-        package_path = os.path.join(path, tool, package + "-result.json")
-
-        with open(package_path) as input_json:
-            deserialized_bom = Bom.from_json(data=json.loads(input_json.read())) # type: ignore
-
-            graph = DependencyGraph()
-            extract_dependencies(deserialized_bom.dependencies, None, graph) # type: ignore
-            results[tool] = graph
-
-    return results
-
-def import_ds2_sboms(path: str, package: str) -> dict[str, DependencyGraph]:
-    results = {}
-
-    tools = [file for file in os.listdir(path) if ".json" in file]
-    for tool in tools:
-        tool_path = os.path.join(path, tool)
-
-        with open(tool_path) as input_json:
-            graph = DependencyGraph()
-            try:
-                deserialized_bom = Bom.from_json(data=json.loads(input_json.read())) # type: ignore
-
-                extract_dependencies(deserialized_bom.dependencies, None, graph) # type: ignore
-            except Exception as e:
-                print("Failed to process {}, error: {}".format(tool_path, e))
-                continue
-            finally:
-                results[tool[:-5]] = graph
-
-    return results
-
-def generate_ds2():
-    def extract_ground_truth_dependencies(
-        child_packages: list, 
-        parent_package: Package | None, 
-        graph: DependencyGraph
-    ):
-        for child in child_packages:
-            package_name = None
-            if "package" in child:
-                package_name = child["package"]["package_name"]
-            else:
-                package_name = child["package_name"]
-            child_package = graph.insert_package(package_name)
-            if "dependencies" in child and len(child["dependencies"]) > 0:
-                extract_ground_truth_dependencies(child["dependencies"], child_package, graph)
-
-            if (parent_package is not None):
-                graph.insert_importstatement(parent_package, child_package)
+def iter_cyclonedx_components(components: list[dict]) -> Iterator[dict]:
+    # components may nest their own components
+    stack = list(reversed(components))
+    while stack:
+        component = stack.pop()
+        yield component
+        stack.extend(reversed(component.get("components", [])))
+
+def spdx_dependencies(
+    relationships: list[tuple[str, str, str]], 
+    names: dict[str, str]
+) -> list[tuple[str, list[str]]]:
+    """
+    Turns SPDX (element, type, related element) relationships into the (ref, dependsOn) of CycloneDX, 
+    relationships with anything but packages (the document, files) being left out
+    """
+    depends_on = {}
+    for element, relationship_type, related_element in relationships:
+        if relationship_type == "DEPENDS_ON":
+            parent, child = element, related_element
+        elif relationship_type.endswith("DEPENDENCY_OF"): # DEPENDENCY_OF, DEV_DEPENDENCY_OF, RUNTIME_DEPENDENCY_OF...
+            parent, child = related_element, element
+        else:
+            continue
+        if parent in names and child in names:
+            depends_on.setdefault(parent, []).append(child)
+    return list(depends_on.items())
+
+SBOM_ARRAYS = {"components", "dependencies", "packages", "relationships"}
+SBOM_VALUES = {"bomFormat", "spdxVersion", "metadata"}
+
+# O(n + e) => the document is read once, whatever its format
+def import_sbom(sbom_path: str) -> DependencyGraph:
+    """
+    Streams a CycloneDX (components, dependencies) or SPDX 2.x (packages, relationships) document 
+    into the same graph builder. The format is told by bomFormat or spdxVersion, which may come 
+    after the arrays, hence both formats being collected during the single pass
+    """
+    sbom_format = None
+    names = {} # bom-ref or SPDXID -> name
+    refs = [] # in the document's order
+    dependencies = []
+    relationships = []
+    with open(sbom_path) as input_json:
+        for key, value in iter_top_level_arrays(input_json, SBOM_ARRAYS, SBOM_VALUES):
+            if key == "bomFormat":
+                sbom_format = "cyclonedx"
+            elif key == "spdxVersion":
+                sbom_format = "spdx"
+            elif key == "metadata":
+                # the component the document is about, which only shows up in the dependencies otherwise
+                if isinstance(value, dict) and "component" in value and "bom-ref" in value["component"]:
+                    names[value["component"]["bom-ref"]] = value["component"]["name"]
+            elif key == "components":
+                for component in iter_cyclonedx_components([value]):
+                    if "bom-ref" in component:
+                        names[component["bom-ref"]] = component["name"]
+                        refs.append(component["bom-ref"])
+            elif key == "dependencies":
+                dependencies.append((value["ref"], value.get("dependsOn", [])))
+            elif key == "packages":
+                names[value["SPDXID"]] = value["name"]
+                refs.append(value["SPDXID"])
+            elif key == "relationships":
+                relationships.append((value["spdxElementId"], value["relationshipType"], value["relatedSpdxElement"]))
+
+    # anything else (ORT's CycloneDX, converted from XML, has everything under "bom") gives an empty graph
+    if sbom_format == "spdx":
+        dependencies = spdx_dependencies(relationships, names)
+
+    graph = DependencyGraph()
+    extract_dependencies(dependencies, graph, names)
+    for ref in refs: # components and packages nothing depends on, nor which depend on anything
+        graph.insert_package(names[ref])
+    return graph
+
+def import_ds2_sbom(tool_path: str) -> DependencyGraph:
+    try:
+        return import_sbom(tool_path)
+    except Exception as e:
+        print("Failed to process {}, error: {}".format(tool_path, e))
+        return DependencyGraph()
+
+# O(n + e) => every package gets expanded once, however many parents it has
+def extract_ground_truth_dependencies(
+    child_packages: list, 
+    parent_package: Package | None, 
+    graph: DependencyGraph
+):
+    """
+    deptree repeats the whole subtree of a package under each of its parents: only the first non-empty one is expanded, 
+    the others only adding their import statement. Runs with a stack, import statements being inserted once 
+    the child's subtree is done, as the recursion did
+    """
+    expanded = set()
+    # frames are (remaining children, their parent, import statement to insert once they are all done)
+    stack = [(iter(child_packages), parent_package, None)]
+    while stack:
+        remaining, parent, pending_statement = stack[-1]
+        child = next(remaining, None)
+        if child is None:
+            stack.pop()
+            if pending_statement is not None:
+                graph.insert_importstatement(*pending_statement)
+            continue
 
+        package_name = None
+        if "package" in child:
+            package_name = child["package"]["package_name"]
+        else:
+            package_name = child["package_name"]
+        child_package = graph.insert_package(package_name)
+        statement = (parent, child_package) if parent is not None else None
+
+        # cycles are cut by deptree with an empty list, which thus does not count as an expansion
+        if "dependencies" in child and len(child["dependencies"]) > 0 and package_name not in expanded:
+            expanded.add(package_name)
+            stack.append((iter(child["dependencies"]), child_package, statement))
+        elif statement is not None:
+            graph.insert_importstatement(*statement)
+
+def import_ground_truth(ground_truth_path: str) -> DependencyGraph:
+    ground_truth_dict = {}
+    with open(ground_truth_path) as ground_truth_file:
+        ground_truth_dict = json.loads(ground_truth_file.read())
+    graph = DependencyGraph()
+    extract_ground_truth_dependencies(ground_truth_dict, None, graph)
+
+    return graph
+
+def generate_ds2(executor: Executor | None = None):
     sources_by_package = {
         "apprise": os.path.join(DS2_PATH, "packages", "apprise", "apprise", "apprise.py"),
         "django-rest-framework": os.path.join(DS2_PATH, "packages", "django-rest-framework", "rest_framework"),
@@ -163,45 +461,53 @@ def generate_ds2():
         "ydata-profiling": os.path.join(DS2_PATH, "packages", "ydata-profiling", "src")
     }
         
-    packages = os.listdir(os.path.join(DS2_PATH, "packages"))
+    packages = [
+        package for package in sorted(os.listdir(os.path.join(DS2_PATH, "packages")), key=str.lower) 
+        if os.path.exists(os.path.join(DS2_PATH, "packages", package, "requirements.txt"))
+    ]
+    tools_by_package = {
+        package: [file for file in sorted(os.listdir(os.path.join(DS2_PATH, "sbom", package)), key=str.lower) if ".json" in file] 
+        for package in packages
+    }
     dataset = Dataset()
 
-    for package in packages: 
-        # requirements
-        requirements_path = os.path.join(DS2_PATH, "packages", package, "requirements.txt")
-        if not os.path.exists(requirements_path):
-            continue
-        
-        raw_requirements = list()
-
-        with open(requirements_path) as requirements_file:
-            for req in requirements.parse(requirements_file):
-                if (req.name is None):
-                    raw_requirements.append(req.line)
-                else:
-                    raw_requirements.append(req.name)
-        # ground truth
-        ground_truth_dict = {}
-        ground_truth_path = os.path.join(DS2_PATH, "deptree_gt", package + "-deptree.json")
-        with open(ground_truth_path) as ground_truth_file:
-            ground_truth_dict = json.loads(ground_truth_file.read())
-        graph = DependencyGraph()
-        extract_ground_truth_dependencies(ground_truth_dict, None, graph)
-
-        # the rest
+    # every package's requirements and ground truth, and every (package, tool), is a unit of its own
+    all_requirements = map_units(
+        read_requirements, 
+        [os.path.join(DS2_PATH, "packages", package, "requirements.txt") for package in packages], 
+        executor
+    )
+    all_ground_truths = map_units(
+        import_ground_truth, 
+        [os.path.join(DS2_PATH, "deptree_gt", package + "-deptree.json") for package in packages], 
+        executor
+    )
+    all_graphs = map_units(
+        import_ds2_sbom, 
+        [os.path.join(DS2_PATH, "sbom", package, tool) for package in packages for tool in tools_by_package[package]], 
+        executor
+    )
+
+    for package, raw_requirements, ground_truth in zip(packages, all_requirements, all_ground_truths): 
         dataset.package_analyses[package] = PackageAnalysis(
             source_path=sources_by_package[package],
             raw_packages_from_metadata=raw_requirements,
-            graphs=import_ds2_sboms(os.path.join(DS2_PATH, "sbom", package), package),
+            graphs={tool[:-5]: next(all_graphs) for tool in tools_by_package[package]},
             packages_path=os.path.join(DS2_PATH, "packages", package, "env", "lib", "python3.10", "site-packages"),
-            ground_truth=graph
+            ground_truth=ground_truth
         )
         
 
     with open("merged_ds2.json", "w") as json_file:
         json_file.write(
-           json.dumps(asdict(dataset))
+           json.dumps(dataset.to_dict())
         )           
     
-generate_ds1()
-generate_ds2()
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merges both datasets' SBOMs, requirements and ground truths into json files")
+    parser.add_argument("--jobs", type=int, default=1, help="amount of processes the (package, tool) units are spread across")
+    arguments = parser.parse_args()
+
+    with (ProcessPoolExecutor(max_workers=arguments.jobs) if arguments.jobs > 1 else nullcontext()) as executor:
+        generate_ds1(executor)
+        generate_ds2(executor)
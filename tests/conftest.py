@@ -0,0 +1,29 @@
+import ast
+import json
+import os
+import sys
+import types
+
+import pytest
+
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY_PATH)
+
+@pytest.fixture(scope="session")
+def notebook() -> types.ModuleType:
+    """
+    The definitions of task2.ipynb as a module, so that the process pools can pickle them. 
+    Only the cells defining functions or classes are run, not the ones going over the datasets
+    """
+    with open(os.path.join(REPOSITORY_PATH, "task2.ipynb"), encoding="utf-8") as notebook_file:
+        cells = json.loads(notebook_file.read())["cells"]
+
+    module = types.ModuleType("task2")
+    sys.modules["task2"] = module
+    for cell in cells:
+        source = "".join(cell["source"])
+        if cell["cell_type"] != "code":
+            continue
+        if any(isinstance(node, (ast.FunctionDef, ast.ClassDef)) for node in ast.parse(source).body):
+            exec(compile(source, "task2.ipynb", "exec"), module.__dict__)
+    return module
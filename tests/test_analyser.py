@@ -0,0 +1,177 @@
+import os
+
+import pytest
+
+PACKAGES = {
+    "alpha": "import gamma\n",
+    "beta": "import gamma\nfrom delta import something\n",
+    "gamma": "import os\nfrom . import helpers\n",
+    "delta": "import alpha\n", # back to alpha, a cycle
+}
+
+@pytest.fixture
+def project(tmp_path) -> tuple[str, str]:
+    """
+    A project importing alpha and beta out of a site-packages of four distributions, returns (source_path, packages_path)
+    """
+    packages_path = tmp_path / "site-packages"
+    source_path = tmp_path / "project"
+    source_path.mkdir()
+    (source_path / "main.py").write_text("import alpha\nimport beta\nimport sys\n")
+    for name, source in PACKAGES.items():
+        (packages_path / name).mkdir(parents=True)
+        (packages_path / name / "__init__.py").write_text(source)
+        dist_info_path = packages_path / "{}-1.0.dist-info".format(name)
+        dist_info_path.mkdir()
+        (dist_info_path / "METADATA").write_text("Metadata-Version: 2.1\nName: {}\nVersion: 1.0\n".format(name))
+        (dist_info_path / "top_level.txt").write_text(name + "\n")
+    return (str(source_path), str(packages_path))
+
+def analyse_recursively(analyser, file_path: str, importer: str) -> None:
+    """
+    The traversal the worklist replaced: every import is followed as soon as it is found
+    """
+    if file_path in analyser._visited_nodes:
+        return
+    for next_path, next_importer in analyser._parse_and_visit(file_path, 0, importer):
+        analyse_recursively(analyser, next_path, next_importer)
+
+def edges(graph) -> set[tuple[str, str]]:
+    return set((s.who_imports.name, s.who_is_imported.name) for s in graph.import_statements)
+
+def analyser_of(notebook, project, **options):
+    source_path, packages_path = project
+    return notebook.PackageAnalyser(source_path, "project", index=notebook.ModuleResolver([packages_path]), **options)
+
+def test_worklist_matches_the_recursive_traversal(notebook, project):
+    reference = analyser_of(notebook, project)
+    analyse_recursively(reference, os.path.join(project[0], "main.py"), "main")
+    assert edges(reference.graph) == {
+        ("main", "alpha"), ("main", "beta"), ("alpha", "gamma"), ("beta", "gamma"), ("beta", "delta"), ("delta", "alpha")
+    }
+
+    for order in ("bfs", "dfs"):
+        for options in ({}, {"jobs": 2}, {"prefetch_threads": 2}):
+            analyser = analyser_of(notebook, project)
+            analyser.analyse(order=order, **options)
+            assert analyser.graph == reference.graph, (order, options)
+            assert set(analyser._visited_nodes) == set(reference._visited_nodes), (order, options)
+
+def test_bfs_reaches_each_file_at_its_lowest_level(notebook, project):
+    analyser = analyser_of(notebook, project)
+    analyser.analyse(order="bfs")
+    levels = {os.path.basename(os.path.dirname(path)): level for path, level in analyser._visited_nodes.items()}
+    assert levels == {"project": 0, "alpha": 1, "beta": 1, "gamma": 2, "delta": 2}
+
+def test_max_depth_stops_after_that_many_levels(notebook, project):
+    analyser = analyser_of(notebook, project)
+    analyser.analyse(max_depth=1)
+    visited = set(os.path.basename(os.path.dirname(path)) for path in analyser._visited_nodes)
+    assert visited == {"project", "alpha", "beta"}
+    assert edges(analyser.graph) == {
+        ("main", "alpha"), ("main", "beta"), ("alpha", "gamma"), ("beta", "gamma"), ("beta", "delta")
+    }
+    assert analyser.graph.unexpanded_packages == {notebook.Package("gamma"), notebook.Package("delta")}
+    assert not analyser.complete
+
+    analyser.analyse(resume=True)
+    assert analyser.complete
+    assert edges(analyser.graph) == edges(analyser_of(notebook, project).analyse())
+
+def test_bytecode_gives_the_same_graph_as_the_sources(notebook, project):
+    import compileall
+    compileall.compile_dir(project[0], quiet=1)
+    compileall.compile_dir(project[1], quiet=1)
+
+    expected = analyser_of(notebook, project)
+    expected.analyse()
+    for options in ({}, {"jobs": 2}, {"prefetch_threads": 2}):
+        analyser = analyser_of(notebook, project, use_bytecode=True)
+        analyser.analyse(**options)
+        assert analyser.graph == expected.graph, options
+        assert analyser.files_read == 0, options
+
+SOURCES = [
+    "import a\nfrom b.c import d\nfrom . import e\nfrom ..f import g\nimport h.i as j, k\n",
+    "def f():\n    import a\nclass A:\n    from b import c\n    def g(self):\n        import d\n",
+    "try:\n    import a\nexcept ImportError:\n    from b import a\n",
+]
+
+@pytest.mark.parametrize("source", SOURCES)
+def test_bytecode_imports_match_extract_imports(notebook, tmp_path, source: str):
+    import py_compile
+    file_path = tmp_path / "module.py"
+    file_path.write_text(source)
+    py_compile.compile(str(file_path))
+    assert notebook.read_bytecode_imports(str(file_path)) == notebook.extract_imports(source.encode())
+
+def test_stale_bytecode_is_not_used(notebook, tmp_path):
+    import py_compile
+    file_path = tmp_path / "module.py"
+    for mode in (py_compile.PycInvalidationMode.TIMESTAMP, py_compile.PycInvalidationMode.UNCHECKED_HASH):
+        file_path.write_text("import a\n")
+        py_compile.compile(str(file_path), invalidation_mode=mode)
+        assert notebook.read_bytecode_imports(str(file_path)) == (("import", "a"),)
+        file_path.write_text("import bb\n") # another size, should the modification time stay the same
+        assert notebook.read_bytecode_imports(str(file_path)) is None
+        assert notebook.scan_file(str(file_path), use_bytecode=True)[2:] == ((("import", "bb"),), None)
+
+def cache_size(cache) -> int:
+    return sum(os.path.getsize(os.path.join(root, file)) for root, _, files in os.walk(cache.directory) for file in files)
+
+def test_lowered_max_bytes_is_enforced_without_puts(notebook, tmp_path):
+    cache = notebook.ImportCache(str(tmp_path))
+    for i in range(20):
+        cache.put(cache.key(str(i).encode()), (("import", "module{}".format(i)),))
+    cache.evict()
+    assert cache_size(cache) > 100
+
+    cache.max_bytes = 100 # on the same object, nothing written since the last eviction
+    cache.evict()
+    assert 0 < cache_size(cache) <= 100
+
+    warm_cache = notebook.ImportCache(str(tmp_path), max_bytes=50) # a later run over the warm cache, size unknown
+    warm_cache.evict()
+    assert cache_size(warm_cache) <= 50
+
+def test_archives_are_closed_once_analysed(notebook, project, tmp_path):
+    import tarfile
+    import zipfile
+    source_path, packages_path = project
+    wheel_path = str(tmp_path / "project-1.0-py3-none-any.whl")
+    sdist_path = str(tmp_path / "project-1.0.tar.gz")
+    with zipfile.ZipFile(wheel_path, "w") as wheel:
+        wheel.write(os.path.join(source_path, "main.py"), "main.py")
+    with tarfile.open(sdist_path, "w:gz") as sdist:
+        sdist.add(os.path.join(source_path, "main.py"), "project-1.0/main.py")
+
+    for archive_path in (wheel_path, sdist_path):
+        for options in ({}, {"prefetch_threads": 2}):
+            analyser = notebook.PackageAnalyser(archive_path, "project", index=notebook.ModuleResolver([packages_path]))
+            analyser.analyse(**options)
+            assert ("main", "alpha") in edges(analyser.graph)
+            assert notebook._open_archives == {} and notebook._archive_users == 0
+
+    notebook.list_archive_members(wheel_path)
+    mapped_file = notebook._open_archives[wheel_path].fp
+    notebook.close_archives()
+    assert mapped_file.closed
+
+def test_unreached_files_are_not_parsed_again(notebook, project, tmp_path):
+    source_path, packages_path = project
+    main_path = os.path.join(source_path, "main.py")
+    def analyse():
+        analyser = notebook.IncrementalAnalyser(
+            source_path, "project", str(tmp_path / "state.json"), index=notebook.ModuleResolver([packages_path])
+        )
+        return analyser.analyse_incrementally()
+
+    assert len(analyse().parsed_files) == 5
+    with open(main_path, "w") as main_file:
+        main_file.write("import sys\n")
+    diff = analyse()
+    assert diff.parsed_files == [main_path] and len(diff.removed_files) == 4
+    with open(main_path, "w") as main_file:
+        main_file.write("import alpha\nimport beta\n")
+    diff = analyse()
+    assert diff.parsed_files == [main_path] and ("main", "alpha") in diff.added_import_statements
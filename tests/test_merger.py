@@ -0,0 +1,76 @@
+import pytest
+
+from merger import DependencyGraph, ImportStatement, Package, extract_ground_truth_dependencies
+
+def expand_recursively(child_packages: list, parent_package: Package | None, graph: DependencyGraph):
+    """
+    The expansion extract_ground_truth_dependencies replaced, every repeated subtree being walked again
+    """
+    for child in child_packages:
+        if "package" in child:
+            package_name = child["package"]["package_name"]
+        else:
+            package_name = child["package_name"]
+        child_package = graph.insert_package(package_name)
+        if "dependencies" in child and len(child["dependencies"]) > 0:
+            expand_recursively(child["dependencies"], child_package, graph)
+        if parent_package is not None:
+            graph.insert_importstatement(parent_package, child_package)
+
+def deptree(dependencies: dict[str, list[str]], roots: list[str]) -> list:
+    """
+    Renders dependencies as deptree does: the whole subtree of a package under each of its parents, 
+    a package already on the path being cut with an empty list
+    """
+    def render(package_name: str, path: tuple[str, ...], top_level: bool) -> dict:
+        node = {"package": {"package_name": package_name}} if top_level else {"package_name": package_name}
+        if package_name in path:
+            node["dependencies"] = []
+        else:
+            node["dependencies"] = [render(child, path + (package_name,), False) for child in dependencies.get(package_name, [])]
+        return node
+
+    return [render(root, (), True) for root in roots]
+
+def diamonds(levels: int) -> dict[str, list[str]]:
+    # each level doubles the times deptree repeats the subtree below it
+    dependencies = {}
+    for level in range(levels):
+        dependencies["top{}".format(level)] = ["left{}".format(level), "right{}".format(level)]
+        dependencies["left{}".format(level)] = ["top{}".format(level + 1)]
+        dependencies["right{}".format(level)] = ["top{}".format(level + 1), "shared"]
+    return dependencies
+
+TREES = {
+    "deep diamonds": deptree(diamonds(12), ["top0", "shared"]),
+    "cycles": deptree(
+        {"a": ["b"], "b": ["c", "d"], "c": ["a"], "d": ["e", "b"], "e": ["d", "f"], "f": ["a"], "g": ["e", "c"]}, 
+        ["g", "a", "d", "f"]
+    ),
+    "diamonds into a cycle": deptree({**diamonds(12), "top12": ["x"], "x": ["y"], "y": ["x", "top0"]}, ["top0", "y"]),
+}
+
+@pytest.mark.parametrize("name", TREES)
+def test_expansion_matches_the_recursive_one(name: str):
+    expected, graph = DependencyGraph(), DependencyGraph()
+    expand_recursively(TREES[name], None, expected)
+    extract_ground_truth_dependencies(TREES[name], None, graph)
+    assert graph.to_dict() == expected.to_dict()
+
+def test_deep_chain_does_not_recurse():
+    node = {"package_name": "5000", "dependencies": []}
+    for i in reversed(range(5000)):
+        node = {"package_name": str(i), "dependencies": [node]}
+    graph = DependencyGraph()
+    extract_ground_truth_dependencies([node], None, graph)
+    assert graph.has_importstatement(Package("4999"), Package("5000"))
+
+def test_neighbours_are_import_statements():
+    graph = DependencyGraph()
+    a, b, c = Package("a"), Package("b"), Package("c")
+    graph.insert_importstatement(a, b)
+    graph.insert_importstatement(a, c)
+    graph.insert_importstatement(c, b)
+    assert graph.imports(a) == [ImportStatement(a, b), ImportStatement(a, c)]
+    assert graph.imported_by(b) == [ImportStatement(a, b), ImportStatement(c, b)]
+    assert graph.imports(Package("d")) == []
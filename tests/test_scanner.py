@@ -0,0 +1,33 @@
+import pytest
+
+SOURCES = [
+    "import os\nfrom . import x\nfrom ..a.b import c\nimport a.b as c, d\n",
+    "import café\n",
+    "import a.café\n",
+    "from café.x import y\n",
+    "import a\\\n  .b\n",
+    "import \\\n  a\nfrom a \\\n  . b\\\n import c\n",
+    "try: import a\nexcept ImportError: pass\n",
+    "s = '''\nimport not_an_import\n'''\n# import neither\n",
+    "import a\ndef f():\n    import b\nclass A:\n    import c\n    def g(self):\n        import d\nimport e\n",
+    "@decorator\nasync def f():\n    import a\nif TYPE_CHECKING:\n    import b\n",
+    "if a:\n    def f():\n        pass\nelse:\n        import x\n",
+    "def f():\n    x = g(\n1)\n    import a\n    y = 1 + \\\n2\n    import b\nimport c\n",
+    "if a:\n\tdef f():\n\t\timport a\n\timport b\n",
+    "class A(\n    B):\n    import a\nimport b\n",
+]
+
+@pytest.mark.parametrize("include_bodies", [True, False])
+@pytest.mark.parametrize("source", SOURCES)
+def test_scan_imports_matches_extract_imports(notebook, source: str, include_bodies: bool):
+    raw_source = source.encode("utf-8")
+    assert notebook.scan_imports(raw_source, include_bodies) == notebook.extract_imports(raw_source, include_bodies)
+
+def test_non_ascii_and_continued_names(notebook):
+    assert notebook.scan_imports("import café\n".encode("utf-8")) == (("import", "café"),)
+    assert notebook.scan_imports(b"import a\\\n  .b\n") == (("import", "a.b"),)
+
+def test_bodies_are_left_out_when_asked(notebook):
+    raw_source = b"import a\ndef f():\n    import b\nclass A:\n    import c\nif x:\n    import d\n"
+    assert notebook.scan_imports(raw_source) == (("import", "a"), ("import", "b"), ("import", "c"), ("import", "d"))
+    assert notebook.scan_imports(raw_source, include_bodies=False) == (("import", "a"), ("import", "d"))